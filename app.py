@@ -8,9 +8,24 @@ from ga_module import(
     generate_coordinates,
     run_ga,
     plot_routes,
-    evalVRP,
 )
 
+# cached GA run, streamlit reruns the whole script on every widget change so the same inputs reuse the earlier result,
+# only the latest few parameter combinations are kept
+@st.cache_data(max_entries=16)
+def _cached_run_ga(locations, depot, num_vehicles, pop_size, cxpb, mutpb, tournsize, ngen, random_seed):
+    return run_ga(
+        locations=list(locations),
+        depot=depot,
+        num_vehicles=num_vehicles,
+        pop_size=pop_size,
+        cxpb=cxpb,
+        mutpb=mutpb,
+        tournsize=tournsize,
+        ngen=ngen,
+        random_seed=random_seed,
+    )
+
 # page 1 configurations
 
 st.set_page_config(
@@ -110,9 +125,10 @@ st.dataframe(coords_df.style.format({"X": "{:.2f}", "Y": "{:.2f}"}), height=250)
 # when the run GA button is clicked
 if run_button:
     with st.spinner("Running Genetic Algorithm..."):
-        # calling the function sending the parameters and storing the results of the functions into the variable names
-        best_individual, logbook = run_ga(
-            locations=locations,
+        # calling the function sending the parameters and storing the results of the functions into the variable names,
+        # the locations are passed as a tuple for the cache key
+        best_individual, logbook = _cached_run_ga(
+            locations=tuple(locations),
             depot=depot,
             num_vehicles=num_vehicles,
             pop_size=pop_size,
@@ -139,19 +155,26 @@ if run_button:
     ax1.legend()
     st.pyplot(fig1, use_container_width=True) # using the container width=True to make the plot wider and broader
 
-    # optimized route plots
+    total_dist, variance = best_individual.fitness.values  # the GA already stored the total_distance and variance of the best route as its fitness
+
+    # the route figure is created once per session and drawn again on every run, creating a figure is slow
+    if "route_fig" not in st.session_state:
+        st.session_state.route_fig = plt.subplots(figsize=(8, 8))
+    _, route_ax = st.session_state.route_fig
+
+    # optimized route plots, passing the values calculated above so the plot does not evaluate the route again
     route_fig = plot_routes(
         individual=best_individual,
         locations=locations,
         depot=depot,
         num_vehicles=num_vehicles,
         title="Optimized Vehicle Routes",
+        total_dist=total_dist,
+        variance=variance,
+        ax=route_ax,
     )
     st.pyplot(route_fig, use_container_width=True)
 
-    total_dist, variance = evalVRP(best_individual, locations, depot, num_vehicles)  # storing the values of total_distance and variance which were calculated using the
-    #  evalVRP function which is declared in the ga_module.py
-
     st.markdown(f"""
     **🔢 Route Summary**
     - **Total Distance:** `{total_dist:.2f}` 
@@ -163,7 +186,7 @@ if run_button:
     route_order = pd.DataFrame(
         {
             "Step": list(range(len(best_individual))),
-            "Location Index": best_individual,
+            "Location Index": list(best_individual),
         }
     )
 
@@ -1,21 +1,28 @@
 # ga_module.py
 
-import random
 import math
+import array
+from collections import OrderedDict
+from operator import attrgetter
 import numpy as np
 import matplotlib.pyplot as plt
-from deap import base, creator, tools, algorithms
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from deap import base, creator, tools
+from numba import njit
 
-# function to find distance between two points
+# function to find distance between two points, the coordinates are small so the overflow checks of math.hypot are not needed
 def euclidean_distance(a, b):
-    return math.hypot(a[0] - b[0], a[1] - b[1])
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    return math.sqrt(dx * dx + dy * dy)
 
 # function to generate the random coordinates
 def generate_coordinates(n, x_range=(100, 1000), y_range=(100, 1000)):
-    return [
-        (random.uniform(*x_range), random.uniform(*y_range))
-        for _ in range(n)
-    ]
+    rng = np.random.default_rng()
+    xs = rng.uniform(*x_range, size=n)
+    ys = rng.uniform(*y_range, size=n)
+    return list(zip(xs.tolist(), ys.tolist()))
 
 # evaluation function returning total_distance traversed and the variance between distance traversed by each vehicle
 def evalVRP(individual, locations, depot, num_vehicles):
@@ -41,6 +48,136 @@ def evalVRP(individual, locations, depot, num_vehicles):
     variance = np.var(distance_by_truck)
     return (total_dist, variance)
 
+# building the pairwise distance matrix once, depot is kept at index 0 and location i is at index i+1
+def distance_matrix(locations, depot):
+    pts = np.vstack([[depot], locations]).astype(np.float64)
+    diff = pts[:, None, :] - pts[None, :, :]
+    return np.sqrt((diff ** 2).sum(-1))
+
+# evaluating many individuals in one go, returns an (M, 2) array with the total distance and the variance of every individual
+# routes can be a buffer from route_buffer that is reused between the calls instead of allocating a new one every time
+def evalVRP_batch(individuals, D, num_vehicles, routes=None):
+    ind_mat = np.asarray(individuals, dtype=np.int64) + 1  # shifting by one because the depot takes index 0
+    m, n = ind_mat.shape
+    if routes is None:
+        routes = route_buffer(m, n, num_vehicles)
+    routes = routes[:m]
+
+    # position j is the (j // num_vehicles)-th stop of truck j % num_vehicles, the first and last column of every
+    # route stay 0 (depot) and so do the stops left over when n is not a multiple of num_vehicles,
+    # a depot to depot edge adds nothing to the distance
+    pos = np.arange(n)
+    routes[:, pos % num_vehicles, pos // num_vehicles + 1] = ind_mat
+
+    distance_by_truck = D[routes[..., :-1], routes[..., 1:]].sum(-1)
+
+    # variance from the sum and the sum of squares, cheaper than np.var for the few trucks of every individual
+    total_dist = distance_by_truck.sum(1)
+    mean = total_dist / num_vehicles
+    variance = np.maximum((distance_by_truck * distance_by_truck).sum(1) / num_vehicles - mean * mean, 0.0)
+    return np.stack((total_dist, variance), axis=1)
+
+# (M, num_vehicles, stops + 2) array of depot indices for evalVRP_batch, only the stops of the locations are overwritten on every call
+def route_buffer(m, n, num_vehicles):
+    segs = -(-n // num_vehicles)
+    return np.zeros((m, num_vehicles, segs + 2), dtype=np.int64)
+
+# numba keeps its own random generator, seeding it inside compiled code so the crossover and mutation are reproducible
+@njit(cache=True)
+def _seed_numba(seed):
+    np.random.seed(seed)
+
+# partially matched crossover, the same algorithm as tools.cxPartialyMatched working in place on two int arrays (the np.intc views of the individuals)
+@njit(cache=True)
+def _pmx_numba(a, b):
+    size = min(a.shape[0], b.shape[0])
+    pos_a = np.empty(size, dtype=np.int64)  # pos_a[v] is the position of the value v inside a
+    pos_b = np.empty(size, dtype=np.int64)
+    for i in range(size):
+        pos_a[a[i]] = i
+        pos_b[b[i]] = i
+
+    cxpoint1 = np.random.randint(0, size + 1)
+    cxpoint2 = np.random.randint(0, size)
+    if cxpoint2 >= cxpoint1:
+        cxpoint2 += 1
+    else:
+        cxpoint1, cxpoint2 = cxpoint2, cxpoint1
+
+    # swapping the values inside the cut points and fixing the duplicates using the position arrays
+    for i in range(cxpoint1, cxpoint2):
+        temp1 = a[i]
+        temp2 = b[i]
+        a[i], a[pos_a[temp2]] = temp2, temp1
+        b[i], b[pos_b[temp1]] = temp1, temp2
+        pos_a[temp1], pos_a[temp2] = pos_a[temp2], pos_a[temp1]
+        pos_b[temp1], pos_b[temp2] = pos_b[temp2], pos_b[temp1]
+
+# shuffle mutation, the same algorithm as tools.mutShuffleIndexes working in place on an int array (the np.intc view of an individual)
+@njit(cache=True)
+def _mut_shuffle_numba(a, indpb):
+    size = a.shape[0]
+    for i in range(size):
+        if np.random.random() < indpb:
+            swap_indx = np.random.randint(0, size - 1)
+            if swap_indx >= i:
+                swap_indx += 1
+            a[i], a[swap_indx] = a[swap_indx], a[i]
+
+# DEAP facing wrappers, the individuals are array.array('i') so the kernels change them in place through an np.intc (int32) view,
+# no conversion to int64 and no copy back
+def cx_pmx(ind1, ind2):
+    _pmx_numba(np.frombuffer(ind1, dtype=np.intc), np.frombuffer(ind2, dtype=np.intc))
+    return ind1, ind2
+
+def mut_shuffle(individual, indpb):
+    _mut_shuffle_numba(np.frombuffer(individual, dtype=np.intc), indpb)
+    return (individual,)
+
+# recreate the fitness and individual classes if they are not created,
+# an individual is a contiguous array of C ints instead of a list of python ints
+def _create_types():
+    if "FitnessMin" not in creator.__dict__:
+        creator.create("FitnessMin", base.Fitness, weights=(-1.0, -1.0))
+    # deap.creator outlives a reload of this module, so an older list based Individual can still be registered
+    if "Individual" in creator.__dict__ and not issubclass(creator.Individual, array.array):
+        del creator.Individual
+    if "Individual" not in creator.__dict__:
+        creator.create("Individual", array.array, typecode="i", fitness=creator.FitnessMin)
+
+# copying an individual for the crossover and mutation, the default clone is copy.deepcopy which is slow
+# for a plain array of integers, the fitness is copied as well so the unchanged offspring are not evaluated again
+def _clone_individual(ind):
+    new = creator.Individual(ind)
+    new.fitness.wvalues = ind.fitness.wvalues
+    return new
+
+# tournament selection like tools.selTournament but drawing the aspirants from the numpy generator rng
+def sel_tournament(individuals, k, tournsize, rng):
+    aspirants = rng.integers(0, len(individuals), size=(k, tournsize))
+    return [
+        max((individuals[i] for i in row), key=attrgetter("fitness"))
+        for row in aspirants
+    ]
+
+# crossover and mutation like algorithms.varAnd, all the probability draws of a generation are taken at once from rng
+def var_and(population, toolbox, cxpb, mutpb, rng):
+    offspring = [toolbox.clone(ind) for ind in population]
+
+    # pairing the neighbours (0, 1), (2, 3), ... for the crossover
+    cx_draws = rng.random(len(offspring) // 2)
+    for pair in np.flatnonzero(cx_draws < cxpb):
+        i = 2 * pair + 1
+        offspring[i - 1], offspring[i] = toolbox.mate(offspring[i - 1], offspring[i])
+        del offspring[i - 1].fitness.values, offspring[i].fitness.values
+
+    mut_draws = rng.random(len(offspring))
+    for i in np.flatnonzero(mut_draws < mutpb):
+        offspring[i], = toolbox.mutate(offspring[i])
+        del offspring[i].fitness.values
+
+    return offspring
+
 # running the genetic algorithm function
 def run_ga(
     locations,
@@ -53,30 +190,26 @@ def run_ga(
     ngen=30,
     random_seed=42,
 ):
-    random.seed(random_seed)
-
-    # recreate the fitness and individual classes if they are not created
-    if "FitnessMin" not in creator.__dict__:
-        creator.create("FitnessMin", base.Fitness, weights=(-1.0, -1.0))
-    if "Individual" not in creator.__dict__:
-        creator.create("Individual", list, fitness=creator.FitnessMin)
+    # one generator drives the whole run, the compiled crossover and mutation get their seed from it
+    rng = np.random.Generator(np.random.SFC64(random_seed))
+    _seed_numba(int(rng.integers(2**32)))
+    _create_types()
 
     toolbox = base.Toolbox()
     num_locations = len(locations)
 
     # each individual is just a random permutation of the indices
-    toolbox.register("indices", random.sample, range(num_locations), num_locations)
+    toolbox.register("indices", lambda: rng.permutation(num_locations).tolist())
     toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.indices)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
-    # to find the fitness value of each individual
-    def eval_local(ind):
-        return evalVRP(ind, locations, depot, num_vehicles)
+    # the distances never change during the run so they are calculated only once
+    D = distance_matrix(locations, depot)
 
-    toolbox.register("evaluate", eval_local)
-    toolbox.register("mate", tools.cxPartialyMatched)
-    toolbox.register("mutate", tools.mutShuffleIndexes, indpb=0.05)
-    toolbox.register("select", tools.selTournament, tournsize=tournsize)
+    toolbox.register("clone", _clone_individual)
+    toolbox.register("mate", cx_pmx)
+    toolbox.register("mutate", mut_shuffle, indpb=0.05)
+    toolbox.register("select", sel_tournament, tournsize=tournsize, rng=rng)
 
     pop = toolbox.population(n=pop_size)
     hof = tools.HallOfFame(1)
@@ -84,29 +217,69 @@ def run_ga(
     stats.register("avg", np.mean)
     stats.register("min", np.min)
 
-    pop, logbook = algorithms.eaSimple(
-        pop,
-        toolbox,
-        cxpb=cxpb,
-        mutpb=mutpb,
-        ngen=ngen,
-        stats=stats,
-        halloffame=hof,
-        verbose=False,
-    )
+    logbook = tools.Logbook()
+    logbook.header = ["gen", "nevals"] + stats.fields
+
+    # the batch never holds more than the population so one buffer is enough for the whole run
+    routes = route_buffer(pop_size, num_locations, num_vehicles)
+
+    # fitness of the recently seen routes, selection keeps bringing back the same permutations in the later generations
+    cache = OrderedDict()
+    cache_size = pop_size * 4
+
+    # same steps as algorithms.eaSimple, but all the new individuals of a generation are evaluated in a single batch,
+    # returns the number of individuals really evaluated so nevals in the logbook does not count the cache hits
+    def evaluate_invalid(individuals):
+        invalid_ind = [ind for ind in individuals if not ind.fitness.valid]
+        misses = []
+        for ind in invalid_ind:
+            key = ind.tobytes()
+            if key in cache:
+                cache.move_to_end(key)
+                ind.fitness.values = cache[key]
+            else:
+                misses.append(ind)
+
+        if misses:
+            fitnesses = evalVRP_batch(misses, D, num_vehicles, routes)
+            for ind, fit in zip(misses, fitnesses):
+                ind.fitness.values = cache[ind.tobytes()] = tuple(fit)
+            while len(cache) > cache_size:
+                cache.popitem(last=False)
+        return len(misses)
+
+    nevals = evaluate_invalid(pop)
+    hof.update(pop)
+    logbook.record(gen=0, nevals=nevals, **stats.compile(pop))
+
+    for gen in range(1, ngen + 1):
+        offspring = toolbox.select(pop, len(pop))
+        offspring = var_and(offspring, toolbox, cxpb, mutpb, rng)
+
+        nevals = evaluate_invalid(offspring)
+        hof.update(offspring)
+        pop[:] = offspring
+        logbook.record(gen=gen, nevals=nevals, **stats.compile(pop))
 
     return hof[0], logbook
 
-# plotting the routes using the maplotlib
-def plot_routes(individual, locations, depot, num_vehicles, title="Routes"):
-    total_dist, variance = evalVRP(individual, locations, depot, num_vehicles)
+# plotting the routes using the maplotlib, total_dist and variance are only calculated here if the caller does not pass them
+# an existing ax can be passed to draw on it again instead of creating a new figure every time
+def plot_routes(individual, locations, depot, num_vehicles, title="Routes", total_dist=None, variance=None, ax=None):
+    if total_dist is None or variance is None:
+        total_dist, variance = evalVRP(individual, locations, depot, num_vehicles)
 
-    fig, ax = plt.subplots(figsize=(8, 8))
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(8, 8))
+    else:
+        fig = ax.figure
+        ax.cla()
     colors = ["b", "g", "m", "c", "y", "k"]
 
-    # Plot each location
+    # Plot all the locations at once
+    pts = np.asarray(locations)
+    ax.scatter(pts[:, 0], pts[:, 1], color="blue", zorder=3)
     for idx, (x, y) in enumerate(locations):
-        ax.plot(x, y, "o", color="blue", zorder=3)
         ax.text(x + 5, y + 5, str(idx), fontsize=9, zorder=4)
 
     # Plot depot
@@ -122,17 +295,27 @@ def plot_routes(individual, locations, depot, num_vehicles, title="Routes"):
         bbox=dict(facecolor="white", edgecolor="none", alpha=0.7),
     )
 
-    # Plot each truck’s route
-    for i in range(num_vehicles):
-        route_idxs = [individual[j] for j in range(i, len(individual), num_vehicles)]
-        coords = [depot] + [locations[k] for k in route_idxs] + [depot]
-        xs, ys = zip(*coords)
-        ax.plot(xs, ys, "-", color=colors[i % len(colors)], label=f"Vehicle {i+1}")
+    # Plot every truck’s route as one collection, every truck takes every num_vehicles-th location so a strided view gives its stops
+    ind_arr = np.asarray(individual)
+    depot_pt = np.asarray(depot, dtype=float)[None, :]
+    routes = [
+        np.vstack([depot_pt, pts[ind_arr[i::num_vehicles]], depot_pt])
+        for i in range(num_vehicles)
+    ]
+    route_colors = [colors[i % len(colors)] for i in range(num_vehicles)]
+    ax.add_collection(LineCollection(routes, colors=route_colors))
+    ax.autoscale_view()
+
+    # a collection has no label per route so the legend gets one line per vehicle
+    handles = [
+        Line2D([], [], color=route_colors[i], label=f"Vehicle {i+1}")
+        for i in range(num_vehicles)
+    ]
 
     ax.set_title(f"{title}\nTotal Dist: {total_dist:.2f}, Variance: {variance:.2f}")
     ax.set_xlabel("X")
     ax.set_ylabel("Y")
-    ax.legend()
+    ax.legend(handles=handles)
     ax.grid(True)
-    plt.tight_layout()
+    fig.tight_layout()
     return fig